@@ -1,6 +1,11 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
 import streamlit as st
 import pandas as pd
-from supabase import create_client
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from supabase import ClientOptions, create_client
+import httpx
 import altair as alt
 
 # ============================================================
@@ -22,7 +27,24 @@ if not SUPABASE_URL or not SUPABASE_KEY:
     st.error("❌ Missing SUPABASE_URL or SUPABASE_ANON_KEY in Streamlit Secrets.")
     st.stop()
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+@st.cache_resource
+def get_supabase():
+    """
+    One Supabase client per server process, reused across reruns and sessions.
+    The injected httpx client only caps the connection pool shared by the
+    concurrent table loads; HTTP/2, keep-alive and redirects match what
+    postgrest-py would set up on its own.
+    """
+    http = httpx.Client(
+        http2=True,
+        follow_redirects=True,
+        timeout=20,
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60),
+    )
+    options = ClientOptions(schema="public", httpx_client=http)
+    return create_client(SUPABASE_URL, SUPABASE_KEY, options=options)
+
+supabase = get_supabase()
 
 # ============================================================
 # HELPERS
@@ -32,30 +54,153 @@ def safe_df(data) -> pd.DataFrame:
         return pd.DataFrame()
     return pd.DataFrame(data)
 
-@st.cache_data(ttl=30)
-def load_table(table_name: str, limit: int | None = None) -> pd.DataFrame:
+# Supabase (PostgREST) caps a single response at 1000 rows by default
+PAGE_SIZE = 1000
+
+# Column that gives a table a stable order when it spans several pages.
+# Tables not listed here are assumed to have an `id` column.
+TABLE_ORDER_KEYS: dict[str, str] = {}
+
+def fetch_page(table_name: str, start: int, size: int, columns: str = "*") -> list[dict]:
+    key = TABLE_ORDER_KEYS.get(table_name, "id")
+    res = supabase.table(table_name).select(columns).order(key).range(start, start + size - 1).execute()
+    return res.data or []
+
+def iter_pages(table_name: str, columns: str = "*"):
+    """
+    Yield a table one page of rows at a time, in order. The first request also
+    returns the exact row count. Tables spanning several pages are read ordered
+    by their key (TABLE_ORDER_KEYS), the pages after the first concurrently;
+    if that ordering fails, only the first unordered page is returned.
+    """
+    res = supabase.table(table_name).select(columns, count="exact").range(0, PAGE_SIZE - 1).execute()
+    first = res.data or []
+    total = res.count or 0
+    # The project's "Max rows" setting may cap responses below PAGE_SIZE,
+    # so step by what the server actually returned
+    step = len(first)
+    if not step or total <= step:
+        yield first
+        return
+
+    try:
+        first = fetch_page(table_name, 0, step, columns)
+    except Exception:
+        yield first
+        return
+    yield first
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        yield from ex.map(lambda start: fetch_page(table_name, start, step, columns), range(step, total, step))
+
+@st.cache_data(ttl=30, show_spinner=False)
+def load_table(table_name: str, columns: str = "*") -> pd.DataFrame:
     """
     Load a table from Supabase. Returns empty DF if blocked/missing.
+    `columns` is a PostgREST select list, e.g. "id,name,position".
+    The whole table is read page by page (see iter_pages).
     """
     try:
-        q = supabase.table(table_name).select("*")
-        if limit:
-            q = q.limit(limit)
-        res = q.execute()
-        return safe_df(res.data)
+        # One small frame per page; no single list holding every row
+        frames = [pd.DataFrame(batch) for batch in iter_pages(table_name, columns) if batch]
+        if not frames:
+            return pd.DataFrame()
+        return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
     except Exception as e:
         st.warning(f"⚠️ Could not load '{table_name}'. (Table missing or RLS blocked)")
         st.caption(str(e))
         return pd.DataFrame()
 
+# History grows without bound, so it is read newest-first in fixed-size pages
+HISTORY_PAGE_SIZE = 200
+
+# Types written by the website (index.html); anything else seen in the data is added
+HISTORY_TYPES = ["Member Added", "Contribution", "Loan", "Repayment", "Fine"]
+
+@st.cache_data(ttl=30, show_spinner=False)
+def load_history(
+    before: tuple[str, str | None] | None = None,
+    member: str | None = None,
+    tx_type: str | None = None,
+    start: str | None = None,
+    end: str | None = None,
+    limit: int = HISTORY_PAGE_SIZE,
+) -> pd.DataFrame:
+    """
+    Load one page of history, newest first. Pass the last row already shown
+    as `before=(created_at, id)` to get the next (older) page; `id` breaks
+    ties between rows written in the same instant. If history has no `id`
+    column, pages are keyed on created_at alone.
+    `member` / `tx_type` and the `start` <= created_at < `end` range (ISO
+    dates) are filtered in Postgres, not in pandas.
+    """
+    def query(tiebreak: bool) -> list[dict]:
+        q = supabase.table("history").select("*").order("created_at", desc=True)
+        if tiebreak:
+            q = q.order("id", desc=True)
+        q = q.limit(limit)
+        if before:
+            ts, last_id = before
+            if tiebreak and last_id is not None:
+                # Quoted so both integer and uuid keys work
+                q = q.or_(f'created_at.lt."{ts}",and(created_at.eq."{ts}",id.lt."{last_id}")')
+            else:
+                q = q.lt("created_at", ts)
+        if member:
+            q = q.eq("member", member)
+        if tx_type:
+            q = q.eq("type", tx_type)
+        if start:
+            q = q.gte("created_at", start)
+        if end:
+            q = q.lt("created_at", end)
+        return q.execute().data
+
+    try:
+        try:
+            return safe_df(query(tiebreak=True))
+        except Exception:
+            return safe_df(query(tiebreak=False))
+    except Exception as e:
+        st.warning("⚠️ Could not load 'history'. (Table missing or RLS blocked)")
+        st.caption(str(e))
+        return pd.DataFrame()
+
 def pick_col(df: pd.DataFrame, options: list[str]) -> str | None:
     for c in options:
         if c in df.columns:
             return c
     return None
 
+# Recent Activity columns and the names each may go by, in order of preference
+HISTORY_COLUMN_ALIASES: dict[str, tuple[str, ...]] = {
+    "time": ("created_at", "time", "date", "timestamp"),
+    "type": ("type", "action", "event_type", "category"),
+    "member": ("member_name", "name", "member", "full_name"),
+    "amount": ("amount", "value", "amount_paid"),
+    "interest_pct": ("interest_pct", "interest_rate", "interest_percent"),
+    "total_due": ("total_due", "amount_due", "due_amount"),
+}
+
+def resolve_cols(df: pd.DataFrame, aliases: dict[str, tuple[str, ...]]) -> dict[str, str | None]:
+    """
+    pick_col for a whole alias map in one pass over a set of the columns.
+    """
+    cols = set(df.columns)
+    return {k: next((c for c in v if c in cols), None) for k, v in aliases.items()}
+
 def to_number(s):
-    return pd.to_numeric(s, errors="coerce").fillna(0)
+    # Supabase numeric columns usually arrive as int/float already
+    if not pd.api.types.is_numeric_dtype(s):
+        s = pd.to_numeric(s, errors="coerce")
+    return s.fillna(0)
+
+@st.cache_data(ttl=30, max_entries=16, show_spinner=False)
+def option_list(all_label: str, values: pd.Series, extra: tuple[str, ...] = ()) -> list[str]:
+    """
+    Selectbox options: `all_label` then the sorted distinct values (plus `extra`).
+    Cached on the Series contents, so it is rebuilt only when the data changes.
+    """
+    return [all_label] + sorted(set(values.dropna().astype(str).unique()) | set(extra))
 
 def money(x):
     try:
@@ -64,16 +209,47 @@ def money(x):
         return "$0"
 
 # ============================================================
-# LOAD DATA (common Njangi tables)
+# SIDEBAR NAV (like your website)
 # ============================================================
-members_df            = load_table("members")
-contrib_df            = load_table("contributions")
-foundation_pay_df     = load_table("foundation_payments")
-loans_df              = load_table("loans")
-fines_df              = load_table("fines")
-payouts_df            = load_table("payouts")
-history_df            = load_table("history", limit=200)
-sureties_df           = load_table("sureties")
+# Tables (and PostgREST select lists) each page needs besides history,
+# which the sidebar always uses
+PAGE_TABLES = {
+    "Dashboard": {"members": "*", "contributions": "*", "foundation_payments": "*", "loans": "*"},
+    "Members": {"members": "*"},
+    "Contributions": {"contributions": "*"},
+    "Foundation Payments": {"foundation_payments": "*"},
+    "Loans": {"loans": "*"},
+    "Fines": {"fines": "*"},
+    "Payouts": {"payouts": "*"},
+    "History": {"members": "name"},  # only for the Member filter
+    "Sureties": {"sureties": "*"},
+}
+
+st.sidebar.markdown("### 📌 Menu")
+page = st.sidebar.radio(
+    "Go to",
+    list(PAGE_TABLES),
+    index=0
+)
+
+# ============================================================
+# LOAD DATA (only the tables the selected page shows)
+# ============================================================
+# Each table is its own HTTPS round-trip, so fetch them concurrently.
+# Workers get the script context so load_table's warnings still render.
+with ThreadPoolExecutor(max_workers=8, initializer=add_script_run_ctx, initargs=(None, get_script_run_ctx())) as ex:
+    f_history = ex.submit(load_history)
+    futures = {t: ex.submit(load_table, t, columns=cols) for t, cols in PAGE_TABLES[page].items()}
+
+tables = {t: f.result() for t, f in futures.items()}
+history_df            = f_history.result()
+members_df            = tables.get("members", pd.DataFrame())
+contrib_df            = tables.get("contributions", pd.DataFrame())
+foundation_pay_df     = tables.get("foundation_payments", pd.DataFrame())
+loans_df              = tables.get("loans", pd.DataFrame())
+fines_df              = tables.get("fines", pd.DataFrame())
+payouts_df            = tables.get("payouts", pd.DataFrame())
+sureties_df           = tables.get("sureties", pd.DataFrame())
 
 # ============================================================
 # COMPUTE METRICS (robust to column name differences)
@@ -83,7 +259,9 @@ members_count = len(members_df) if not members_df.empty else 0
 
 # Contributions total (Njangi Pot)
 contrib_amount_col = pick_col(contrib_df, ["amount", "amount_paid", "contribution_amount", "paid_amount", "value"])
-pot_total = to_number(contrib_df[contrib_amount_col]).sum() if (not contrib_df.empty and contrib_amount_col) else 0
+# Coerced once here; the Top 10 chart reuses it
+contrib_amounts = to_number(contrib_df[contrib_amount_col]) if (not contrib_df.empty and contrib_amount_col) else pd.Series(dtype="float64")
+pot_total = contrib_amounts.sum()
 
 # Foundation total (from foundation_payments.amount_paid or amount)
 foundation_amount_col = pick_col(foundation_pay_df, ["amount_paid", "amount", "paid_amount", "value"])
@@ -100,26 +278,16 @@ interest_col = pick_col(history_df, ["interest", "interest_amount", "interest_ge
 total_interest = to_number(history_df[interest_col]).sum() if (not history_df.empty and interest_col) else 0
 
 # ============================================================
-# SIDEBAR NAV (like your website)
+# SIDEBAR
 # ============================================================
-st.sidebar.markdown("### 📌 Menu")
-page = st.sidebar.radio(
-    "Go to",
-    [
-        "Dashboard",
-        "Members",
-        "Contributions",
-        "Foundation Payments",
-        "Loans",
-        "Fines",
-        "Payouts",
-        "History",
-        "Sureties",
-    ],
-    index=0
-)
-
 st.sidebar.markdown("---")
+if st.sidebar.button("🔄 Refresh data"):
+    # Cached tables live for 30s; force a fresh read after edits on the website
+    load_table.clear()
+    load_history.clear()
+    st.session_state.pop("history_extra_pages", None)
+    st.session_state.pop("history_filters", None)
+    st.rerun()
 st.sidebar.metric("Total Interest", money(total_interest))
 st.sidebar.caption("Tip: If data shows 0, Streamlit is likely connected to an empty DB or RLS is blocking reads.")
 
@@ -147,8 +315,9 @@ if page == "Dashboard":
         member_id_col = pick_col(contrib_df, ["member_id", "user_id"])
         created_col = pick_col(contrib_df, ["created_at", "date", "paid_at", "timestamp"])
 
-        work = contrib_df.copy()
-        work[contrib_amount_col] = to_number(work[contrib_amount_col])
+        # Only the key columns and the coerced amounts, not a copy of the whole table
+        key_cols = [c for c in (name_col, member_id_col) if c]
+        work = contrib_df[key_cols].assign(**{contrib_amount_col: contrib_amounts})
 
         # Try to map member names if only member_id exists
         if (not name_col) and member_id_col and not members_df.empty:
@@ -168,10 +337,9 @@ if page == "Dashboard":
             name_col = "member_name_fallback"
 
         top = (
-            work.groupby(name_col, dropna=False)[contrib_amount_col]
+            work.groupby(name_col, dropna=False, sort=False)[contrib_amount_col]
             .sum()
-            .sort_values(ascending=False)
-            .head(10)
+            .nlargest(10)
             .reset_index()
             .rename(columns={name_col: "Member", contrib_amount_col: "Amount"})
         )
@@ -217,35 +385,89 @@ if page == "Dashboard":
         st.info("No history/activity found.")
     else:
         # Try to format typical columns
-        time_col = pick_col(history_df, ["created_at", "time", "date", "timestamp"])
-        type_col = pick_col(history_df, ["type", "action", "event_type", "category"])
-        member_col = pick_col(history_df, ["member_name", "name", "member", "full_name"])
-        amount_col = pick_col(history_df, ["amount", "value", "amount_paid"])
-        interest_pct_col = pick_col(history_df, ["interest_pct", "interest_rate", "interest_percent"])
-        total_due_col = pick_col(history_df, ["total_due", "amount_due", "due_amount"])
+        hist_cols = resolve_cols(history_df, HISTORY_COLUMN_ALIASES)
+        time_col = hist_cols["time"]
 
-        show_cols = [c for c in [time_col, type_col, member_col, amount_col, interest_pct_col, total_due_col] if c]
-        view = history_df[show_cols].copy() if show_cols else history_df.copy()
+        show_cols = [c for c in hist_cols.values() if c]
+        # load_history already returns newest first, so only the shown rows need parsing
+        view = (history_df[show_cols] if show_cols else history_df).head(20).copy()
 
         if time_col and time_col in view.columns:
             # keep as text if parsing fails
             try:
-                view[time_col] = pd.to_datetime(view[time_col], errors="ignore")
-                view = view.sort_values(time_col, ascending=False)
+                view[time_col] = pd.to_datetime(view[time_col], utc=True, format="ISO8601")
             except Exception:
                 pass
 
-        st.dataframe(view.head(20), use_container_width=True)
+        st.dataframe(view, use_container_width=True)
 
 # ============================================================
 # TABLE PAGES
 # ============================================================
-def table_page(title: str, df: pd.DataFrame):
+# Rows sent to the browser before the user asks for the full table
+TABLE_PREVIEW_ROWS = 100
+
+def table_page(title: str, df: pd.DataFrame, preview: bool = True):
+    """
+    `preview=False` renders every row, for frames that already arrive in
+    bounded pages (History).
+    """
     st.subheader(title)
     if df.empty:
         st.info("No data found.")
-    else:
+    elif not preview or len(df) <= TABLE_PREVIEW_ROWS:
+        st.dataframe(df, use_container_width=True)
+    elif st.checkbox(f"Show all {len(df):,} rows", key=f"show_all_{title}"):
         st.dataframe(df, use_container_width=True)
+    else:
+        st.dataframe(df.head(TABLE_PREVIEW_ROWS), use_container_width=True)
+        st.caption(f"Showing the first {TABLE_PREVIEW_ROWS} of {len(df):,} rows.")
+
+@st.fragment
+def render_history():
+    """
+    History filters, table and paging. Runs as a fragment so changing a filter
+    or loading older rows doesn't rerun the whole dashboard.
+    """
+    f1, f2, f3 = st.columns(3)
+    names = members_df["name"] if "name" in members_df.columns else pd.Series(dtype=str)
+    seen_types = history_df["type"] if "type" in history_df.columns else pd.Series(dtype=str)
+    member_names = option_list("All members", names)
+    type_names = option_list("All types", seen_types, tuple(HISTORY_TYPES))
+    selected_member = f1.selectbox("Member", member_names)
+    selected_type = f2.selectbox("Transaction type", type_names)
+    date_range = f3.date_input("Date range", value=())
+    member = None if selected_member == "All members" else selected_member
+    tx_type = None if selected_type == "All types" else selected_type
+    start = date_range[0].isoformat() if len(date_range) > 0 else None
+    # The end date is inclusive, so filter up to the start of the next day
+    end = (date_range[1] + timedelta(days=1)).isoformat() if len(date_range) > 1 else None
+
+    # Changing a filter starts again from the newest page
+    filters = (member, tx_type, start, end)
+    if st.session_state.get("history_filters") != filters:
+        st.session_state["history_filters"] = filters
+        st.session_state["history_extra_pages"] = 0
+
+    # Only the number of older pages is kept; each page's cursor is rebuilt
+    # from the last row of the page before it as fetched on this run, so new
+    # or deleted rows never leave a gap or overlap between pages.
+    first = history_df if not any(filters) else load_history(None, member, tx_type, start, end)
+    pages = [first]
+    for _ in range(st.session_state["history_extra_pages"]):
+        prev = pages[-1]
+        if len(prev) < HISTORY_PAGE_SIZE or "created_at" not in prev.columns:
+            break
+        last = prev.iloc[-1]
+        cursor = (last["created_at"], str(last["id"]) if "id" in prev.columns else None)
+        pages.append(load_history(cursor, member, tx_type, start, end))
+    history_view = pages[0] if len(pages) == 1 else pd.concat(pages, ignore_index=True)
+    table_page("🧾 History", history_view, preview=False)
+
+    if len(pages[-1]) == HISTORY_PAGE_SIZE and "created_at" in history_view.columns:
+        if st.button("⬇️ Load older"):
+            st.session_state["history_extra_pages"] += 1
+            st.rerun(scope="fragment")
 
 if page == "Members":
     table_page("👥 Members", members_df)
@@ -266,7 +488,7 @@ elif page == "Payouts":
     table_page("💸 Payouts", payouts_df)
 
 elif page == "History":
-    table_page("🧾 History", history_df)
+    render_history()
 
 elif page == "Sureties":
     table_page("🛡️ Sureties", sureties_df)